@@ -3,17 +3,24 @@
 #   Tanguy Ophoff
 #
 
-def cache(*args, basefolder='/tmp', extension='.pkl', save_fn=None, load_fn=None):
+def cache(*args, basefolder='/tmp', extension='.pkl', save_fn=None, load_fn=None, protocol=None, optimize=False, in_memory=False, max_entries=32):
     """
     Cache the result of a function to a file.
     By default the saving/loading happens with the pickle module, but you can specify your own funcitons.
+    The default functions store numpy arrays with np.save and numeric pandas DataFrames with string column names as feather files (if pyarrow is installed) instead,
+    which are loaded back as memory-mapped data.
+    Note that cached arrays are thus returned as np.memmap objects, whereas freshly computed results are regular np.ndarray objects.
 
     Args:
         *args: Should not be used, this is here so you can omit braces on the decorator if the defaults are ok
         basefolder (str): Folder to store the cache files; Default '/tmp'
         extension (str): File extension (should start with a dot); Default '.pkl'
-        save_fn (Callable[[T, Path], None]): Function to save your object; Default pickle.dump
-        load_fn (Callable[[Path], T]): Function to load your object; Default pickle.load
+        save_fn (Callable[[T, Path], None]): Function to save your object; Default np.save, feather or pickle.dump
+        load_fn (Callable[[Path], T]): Function to load your object; Default np.load, feather or pickle.load (based on the file contents)
+        protocol (int, optional): Pickle protocol used by the default save_fn; Default pickle.HIGHEST_PROTOCOL
+        optimize (bool, optional): Run pickletools.optimize on the data in the default save_fn (smaller files, slower saving); Default False
+        in_memory (bool, optional): Also keep results in memory, so repeated calls do not need to load the file (returns the same object each time); Default False
+        max_entries (int, optional): Maximum number of results to keep in memory, oldest entries are removed first (None for unlimited); Default 32
 
     Examples:
         >>> @cache
@@ -27,58 +34,151 @@ def cache(*args, basefolder='/tmp', extension='.pkl', save_fn=None, load_fn=None
         ...     time.sleep(5)
         ...     return value
 
-        # Custom functions for dataframes (This is basically a reimplementation of cache_df)
-        >>> @cache(save_fn=lambda df, path: df.to_pickle(path), load_fn=lambda path: pd.read_pickle(path))
+        # Keep the results in memory as well
+        >>> @cache(in_memory=True)
+        ... def baz(value):
+        ...     time.sleep(5)
+        ...     return value
+
+        # Custom functions for dataframes (This is basically a reimplementation of cache_df(format='pickle'))
+        >>> @cache(save_fn=lambda df, path: df.to_pickle(path, protocol=pickle.HIGHEST_PROTOCOL), load_fn=lambda path: pd.read_pickle(path))
         ... def foo_df(**data):
         ...     time.sleep(5)
         ...     return pd.DataFrame(data)
     """
     import logging
+    import os
+    import marshal
     import pickle
+    import pickletools
+    import sys
+    import types
     from functools import wraps
     import hashlib
     from pathlib import Path
 
     log = logging.getLogger('cache')
+    if max_entries is not None and max_entries < 1:
+        raise ValueError(f'max_entries should be at least 1 or None, got {max_entries}')
+    if protocol is None:
+        protocol = pickle.HIGHEST_PROTOCOL
 
     if save_fn is None:
         def save_fn(obj, path):
-            with open(path, 'wb') as f:
-                pickle.dump(obj, f)
+            # Only check for numpy/pandas objects if those libraries are already imported
+            np = sys.modules.get('numpy')
+            pd = sys.modules.get('pandas')
+            if np is not None and type(obj) is np.ndarray and not obj.dtype.hasobject:
+                with open(path, 'wb', buffering=1 << 20) as f:
+                    np.save(f, obj, allow_pickle=False)
+                return
+            if (
+                pd is not None and isinstance(obj, pd.DataFrame)
+                and all(isinstance(col, str) for col in obj.columns)
+                and all(pd.api.types.is_numeric_dtype(t) or pd.api.types.is_bool_dtype(t) for t in obj.dtypes)
+            ):
+                try:
+                    import pyarrow.feather as feather
+                    feather.write_feather(obj, path, compression='uncompressed')
+                    return
+                except Exception:
+                    # pyarrow not installed or dataframe not representable in arrow
+                    pass
+
+            if optimize:
+                path.write_bytes(pickletools.optimize(pickle.dumps(obj, protocol=protocol)))
+            else:
+                with open(path, 'wb', buffering=1 << 20) as f:
+                    pickle.dump(obj, f, protocol=protocol)
 
     if load_fn is None:
         def load_fn(path):
-            with open(path, 'rb') as f:
-                return pickle.load(f)
+            # Dispatch on the magic bytes of the file
+            with open(path, 'rb', buffering=1 << 20) as f:
+                magic = f.peek(6)[:6]
+                if magic not in (b'\x93NUMPY', b'ARROW1'):
+                    return pickle.load(f)
+
+            if magic == b'\x93NUMPY':
+                import numpy as np
+                return np.load(path, mmap_mode='c', allow_pickle=False)
+            else:
+                import pyarrow.feather as feather
+                return feather.read_feather(path, memory_map=True)
+
+    def strip_code(code):
+        # Remove file location information, which changes between notebook sessions
+        consts = tuple(strip_code(c) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+        return code.replace(co_filename='', co_firstlineno=0, co_consts=consts)
+
+    def is_simple(value):
+        # Only these types have a repr that is deterministic and captures their full value
+        if type(value) is tuple:
+            return all(is_simple(v) for v in value)
+        return type(value) in (int, float, bool, str, bytes, type(None))
 
     def cache_inner(func):
         # Compute function hash
-        func_string = (
-            func.__code__.co_code + 
-            "".join(str(cnst) for cnst in func.__code__.co_consts).encode() + 
-            "".join(func.__code__.co_freevars).encode()
-        )
-        func_hash = hashlib.md5(func_string)
+        func_digest = hashlib.blake2b(marshal.dumps(strip_code(func.__code__)), digest_size=16).digest()
+        mem_cache = {}
+        known_paths = set()
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Uppdate hash with args
-            total_hash = func_hash.copy()
-            total_hash.update((str(args) + str(kwargs)).encode())
+            # Update hash with args
+            # Simple args use their repr, others are pickled (or use their string representation if they cannot be pickled)
+            # Kwargs are sorted, so their order does not change the cache key
+            key = (args, tuple(sorted(kwargs.items())))
+            if is_simple(args) and is_simple(tuple(kwargs.values())):
+                args_bytes = repr(key).encode()
+            else:
+                try:
+                    args_bytes = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    args_bytes = str(key).encode()
+            total_hash = hashlib.blake2b(func_digest, digest_size=16)
+            total_hash.update(args_bytes)
             digest = total_hash.hexdigest()
+
+            # Check in-memory cache
+            if digest in mem_cache:
+                log.debug(f'Using in-memory cache for "{func.__name__}" [{digest}]')
+                return mem_cache[digest]
             
             # Get cached path
             cache_path = (Path(basefolder) / f'cache-{digest}').with_suffix(extension)
             
-            # Run function if necessary
-            if cache_path.exists():
-                log.warning(f'Using cache for "{func.__name__}" [{cache_path}]')
-                return load_fn(cache_path)
-            else:
+            # Load cache file (we skip the stat call for files we have already seen)
+            loaded = False
+            if cache_path in known_paths or cache_path.exists():
+                try:
+                    obj = load_fn(cache_path)
+                    loaded = True
+                    known_paths.add(cache_path)
+                    log.warning(f'Using cache for "{func.__name__}" [{cache_path}]')
+                except FileNotFoundError:
+                    known_paths.discard(cache_path)
+
+            # Run function if necessary and save to a temporary file first, so we never leave corrupt cache files behind
+            if not loaded:
                 obj = func(*args, **kwargs)
-                save_fn(obj, cache_path)
+                tmp_path = cache_path.with_name(f'.{cache_path.stem}.tmp{cache_path.suffix}')
+                try:
+                    save_fn(obj, tmp_path)
+                    os.replace(tmp_path, cache_path)
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
+                known_paths.add(cache_path)
                 log.info(f'Saved cache for "{func.__name__}" [{cache_path}]')
-                return obj
+
+            # Store in-memory cache (dicts are ordered, so the first key is the oldest entry)
+            if in_memory:
+                if max_entries is not None and len(mem_cache) >= max_entries:
+                    del mem_cache[next(iter(mem_cache))]
+                mem_cache[digest] = obj
+
+            return obj
 
         return wrapper
 
@@ -87,13 +187,16 @@ def cache(*args, basefolder='/tmp', extension='.pkl', save_fn=None, load_fn=None
     return cache_inner
 
 
-def cache_df(*args, basefolder='/tmp'):
+def cache_df(*args, basefolder='/tmp', format='parquet'):
     """
     Wrapper around cache with defaults for pandas DataFrame objects.
+    By default the dataframes are stored as zstd-compressed parquet files, which requires pyarrow.
+    Dataframes that arrow cannot represent are pickled instead (still using the '.parquet' extension).
 
     Args:
         *args: Should not be used, this is here so you can omit braces on the decorator if the defaults are ok
         basefolder (str): Folder to store the cache files; Default '/tmp'
+        format (str, optional): Storage format, either 'parquet' or 'pickle' (use pickle to skip trying parquet for dataframes that arrow cannot represent); Default 'parquet'
 
     Examples:
         >>> @cache_df
@@ -106,17 +209,86 @@ def cache_df(*args, basefolder='/tmp'):
         ... def bar(**data):
         ...     time.sleep(5)
         ...     return pd.DataFrame(data)
+
+        # Store dataframes with arbitrary python objects
+        >>> @cache_df(format='pickle')
+        ... def baz(**data):
+        ...     time.sleep(5)
+        ...     return pd.DataFrame(data)
     """
+    import pickle
     import pandas as pd
 
+    if format == 'parquet':
+        # Import pyarrow upfront, so we fail before running the decorated function
+        import pyarrow
+
+        def save_fn(df, path):
+            try:
+                df.to_parquet(path, engine='pyarrow', compression='zstd')
+            except (ValueError, TypeError, pyarrow.ArrowException):
+                # Arrow cannot represent this dataframe (eg. mixed object columns or duplicate column names)
+                df.to_pickle(path, protocol=pickle.HIGHEST_PROTOCOL)
+
+        def load_fn(path):
+            # Dispatch on the magic bytes of the file, as we might have fallen back to pickle
+            with open(path, 'rb') as f:
+                magic = f.read(4)
+            if magic == b'PAR1':
+                return pd.read_parquet(path, engine='pyarrow')
+            return pd.read_pickle(path)
+
+        return cache(
+            *args,
+            basefolder=basefolder,
+            extension='.parquet',
+            save_fn=save_fn,
+            load_fn=load_fn,
+        )
+    elif format == 'pickle':
+        return cache(
+            *args,
+            basefolder=basefolder,
+            extension='.pkl',
+            save_fn=lambda df, path: df.to_pickle(path, protocol=pickle.HIGHEST_PROTOCOL),
+            load_fn=pd.read_pickle,
+        )
+    else:
+        raise ValueError(f'Unknown format "{format}", should be one of "parquet" or "pickle"')
+
+
+def cache_npy(*args, basefolder='/tmp', mmap_mode='c'):
+    """
+    Wrapper around cache with defaults for numpy arrays.
+    The arrays are stored with np.save and memory-mapped when loading them back from the cache.
+
+    Args:
+        *args: Should not be used, this is here so you can omit braces on the decorator if the defaults are ok
+        basefolder (str): Folder to store the cache files; Default '/tmp'
+        mmap_mode (str, optional): Memory-map mode passed to np.load (use None to read the whole array in memory); Default 'c'
+
+    Examples:
+        >>> @cache_npy
+        ... def foo(size):
+        ...     time.sleep(5)
+        ...     return np.random.rand(size, size)
+
+        # Load cached arrays fully in memory
+        >>> @cache_npy(mmap_mode=None)
+        ... def bar(size):
+        ...     time.sleep(5)
+        ...     return np.random.rand(size, size)
+    """
+    import numpy as np
+
     return cache(
         *args,
         basefolder=basefolder,
-        extension='.pkl',
-        save_fn=lambda df, path: df.to_pickle(path),
-        load_fn=pd.read_pickle,
+        extension='.npy',
+        save_fn=lambda arr, path: np.save(path, arr, allow_pickle=False),
+        load_fn=lambda path: np.load(path, mmap_mode=mmap_mode),
     )
 
 
 if __name__ == '__main__':
-    print('functions: cache, cache_df')
+    print('functions: cache, cache_df, cache_npy')
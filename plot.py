@@ -47,15 +47,28 @@ def plot_images(*images, nrows=None, ncols=None, titles=None, row_titles=None, c
         if img is None:
             return img
         if torch is not None and isinstance(img, torch.Tensor):
-            return np.transpose(img.cpu().detach().numpy(), (1, 2, 0))
+            img = img.detach().cpu()
+            if img.ndim == 3 and img.shape[0] in (1, 3, 4):
+                # CHW -> HWC in a single contiguous copy
+                img = img.permute(1, 2, 0).contiguous()
+            return img.numpy()
         if Image is not None and isinstance(img, Image.Image):
             return np.asarray(img)
         if isinstance(img, np.ndarray) and img.ndim == 3:
-            return img[..., ::-1]
+            # BGR -> RGB in a single contiguous copy, so imshow does not need to re-stride the data
+            return np.ascontiguousarray(img[..., ::-1])
         return np.asarray(img)
 
-    images = tuple(image_to_array(img) for img in images)
-    avg_ratio = sum(img.shape[0] for img in images if img is not None) / sum(img.shape[1] for img in images if img is not None)
+    arrays, h_sum, w_sum = [], 0, 0
+    for img in images:
+        img = image_to_array(img)
+        arrays.append(img)
+        if img is not None:
+            h_sum += img.shape[0]
+            w_sum += img.shape[1]
+    images = arrays
+    avg_ratio = h_sum / w_sum if w_sum else 1.0
+
     if nrows is None and ncols is None:
         nrows = 1
         ncols = len(images)
@@ -63,43 +76,35 @@ def plot_images(*images, nrows=None, ncols=None, titles=None, row_titles=None, c
         nrows = math.ceil(len(images) / ncols)
     elif ncols is None:
         ncols = math.ceil(len(images) / nrows)
-    fig, axes = plt.subplots(nrows, ncols, figsize=(3*ncols, 3*avg_ratio*nrows), dpi=dpi, constrained_layout=True)
-    axes = axes.flatten() if nrows * ncols > 1 else [axes]
+    with plt.rc_context({'axes.edgecolor': 'black', 'axes.linewidth': 1}):
+        fig, axes = plt.subplots(nrows, ncols, figsize=(3*ncols, 3*avg_ratio*nrows), dpi=dpi, constrained_layout=True, squeeze=False)
+    axes = axes.ravel()
     
     if background is not None:
         fig.patch.set_facecolor(background)
-    for ax in axes:
+    for idx, ax in enumerate(axes):
+        r, c = divmod(idx, ncols)
         ax.grid(False)
         ax.tick_params(left=False, right=False, labelleft=False, labelbottom=False, bottom=False)
-        ax.set_frame_on(False)
 
-    for idx, (ax, img) in enumerate(zip(axes, images)):
+        if c == 0 and row_titles is not None and len(row_titles) > r:
+            ax.set_ylabel(row_titles[r])
+        if r == 0 and col_titles is not None and titles is None and len(col_titles) > c:
+            ax.set_xlabel(col_titles[c])
+            ax.xaxis.set_label_position('top')
+
+        img = images[idx] if idx < len(images) else None
         if img is None:
+            ax.set_frame_on(False)
             continue
         if normalize:
             ax.imshow(img, cmap='gray')
         else:
             ax.imshow(img, vmin=0, vmax=255 if img.max() > 1 else 1, cmap='gray')
 
-        ax.set_frame_on(True)
-        ax.spines[:].set_edgecolor('black')
-        ax.spines[:].set_linewidth(1)
         if titles is not None and len(titles) > idx:
             ax.set_title(titles[idx])
 
-    if row_titles is not None:
-        for idx, title in enumerate(row_titles):
-            if idx >= nrows:
-                break
-            axes[idx * ncols].set_ylabel(title)
-            
-    if col_titles is not None and titles is None:
-        for idx, title in enumerate(col_titles):
-            if idx >= ncols:
-                break
-            axes[idx].set_xlabel(title)
-            axes[idx].xaxis.set_label_position('top') 
-
     return fig
 
 def plot_tide(tide_series, *, errors_lim=None, fpfn_lim=None, no_zero=False, color=None, saturation=0.75, ax=None, **kwargs):
@@ -156,7 +161,11 @@ def plot_tide(tide_series, *, errors_lim=None, fpfn_lim=None, no_zero=False, col
         'mdAP_background': 'BKG',
         'mdAP_missed': 'MISS',
     }
-    errors = tide_series[rename.keys()].rename(rename)
+    missing = [key for key in rename if key not in tide_series.index]
+    if missing:
+        raise KeyError(f'Missing TIDE values in series: {missing}')
+    errors = tide_series.reindex(list(rename.keys()))
+    errors.index = list(rename.values())
     if no_zero:
         errors = errors[errors > 0]
 
@@ -170,7 +179,11 @@ def plot_tide(tide_series, *, errors_lim=None, fpfn_lim=None, no_zero=False, col
         'mdAP_fp': 'FP',
         'mdAP_fn': 'FN',
     }
-    fpfn = tide_series[rename.keys()].rename(rename)
+    missing = [key for key in rename if key not in tide_series.index]
+    if missing:
+        raise KeyError(f'Missing TIDE values in series: {missing}')
+    fpfn = tide_series.reindex(list(rename.keys()))
+    fpfn.index = list(rename.values())
 
     fpfn_ax = fig.add_subplot(gs[-1])
     fpfn_ax.barh(fpfn.index, fpfn.values, **kwargs)
@@ -3,7 +3,7 @@
 #   Tanguy Ophoff
 #
 
-def stratified_splits(df, split_percentages, *, class_column=None, stratify_columns=None):
+def stratified_splits(df, split_percentages, *, class_column=None, stratify_columns=None, seed=None):
     """
     This function splits a dataset in N stratified splits.
     If a `class_column` is given, each class is split independently and the subsplits are combined afterwards, ensuring a similar distribution in each split.
@@ -15,11 +15,13 @@ def stratified_splits(df, split_percentages, *, class_column=None, stratify_colu
         split_percentages (list[float]): The different split percentages (needs to sum to 1)
         class_column (str, optional): The name of the column representing the classes (or most important stratum); Default None
         stratify_column (list[str], optional): The names of columns that need to be taken into account for equal splits; Default None
+        seed (int, optional): Seed for the random number generator, to get reproducible splits; Default None
 
     Returns:
         (list[list[int]]): The indices in each split
 
     Required Libraries:
+        numpy
         pandas
         scikit-learn
 
@@ -28,31 +30,37 @@ def stratified_splits(df, split_percentages, *, class_column=None, stratify_colu
         >>> train_idx, test_idx = stratified_splits(df, [0.8, 0.2], class_column='class_label', stratify_columns=['width', 'height'])
     """
     import math
-    import random
+    import numpy as np
     from sklearn.preprocessing import StandardScaler
     from sklearn.cluster import DBSCAN
     
     assert sum(split_percentages) == 1, 'All splits combined should be 100% of the data'
-    df = df.copy()
-    
-    # Assign constant class if none is given
+    df_index = df.index.to_numpy()
+    df_features = df[stratify_columns].to_numpy() if stratify_columns is not None else None
+
+    # Get row positions of each class (single group if no class is given)
     if class_column is None:
-        class_column = 'stratsplit-klass_col'
-        df[class_column] = 0
+        class_positions = [np.arange(df.shape[0])]
+    else:
+        class_positions = df.groupby(class_column, observed=True).indices.values()
         
     # Loop through classes and split each class in N stratified splits
+    rng = np.random.default_rng(seed)
     splits = [[] for _ in range(len(split_percentages))]
     total = 0
-    for _, group in df.groupby(class_column, observed=True):
+    for positions in class_positions:
         if stratify_columns is not None:
-            features = StandardScaler().fit_transform(group[stratify_columns])
-            group['stratsplit-stratum'] = DBSCAN().fit_predict(features)
+            features = StandardScaler().fit_transform(df_features[positions])
+            strata = DBSCAN(algorithm='kd_tree', leaf_size=40, n_jobs=-1).fit_predict(features)
+            # Sort once and split at the stratum boundaries
+            order = np.argsort(strata, kind='stable')
+            _, stratum_counts = np.unique(strata, return_counts=True)
+            stratum_positions = np.split(positions[order], np.cumsum(stratum_counts)[:-1])
         else:
-            group['stratsplit-stratum'] = 0
+            stratum_positions = [positions]
         
-        for _, subgroup in group.groupby('stratsplit-stratum'):
-            indices = tuple(subgroup.index.tolist())
-            X = len(indices)
+        for sub_positions in stratum_positions:
+            indices = df_index[sub_positions]
             counts = [s * len(indices) for s in split_percentages[:-1]]
             if total > 0:
                 counts = [
@@ -62,13 +70,12 @@ def stratified_splits(df, split_percentages, *, class_column=None, stratify_colu
             else:
                 counts = [math.floor(c) for c in counts]
 
-            for idx, c in enumerate(counts):
-                chosen_idx = random.sample(indices, k=min(len(indices), c))
-                splits[idx].extend(chosen_idx)
-                indices = tuple(i for i in indices if i not in chosen_idx)
-            splits[-1].extend(indices)
+            # Shuffle once and split at the cumulative counts
+            parts = np.split(rng.permutation(indices), np.cumsum(counts))
+            for idx, part in enumerate(parts):
+                splits[idx].extend(part.tolist())
             
-            total += subgroup.shape[0]
+            total += len(indices)
     
     assert sum(len(s) for s in splits) == df.shape[0], 'All elements should be chosen'
     return splits